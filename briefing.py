@@ -4,11 +4,15 @@ briefing.py — AI briefing generator using Claude.
 Formats today's appointment data into a structured prompt, streams the
 response from Claude, and returns the complete briefing text.
 """
+import io
 import logging
-from datetime import date
+import sys
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import attrgetter, itemgetter
 from typing import Any
 
-import anthropic
+from db import Appointment
 
 logger = logging.getLogger(__name__)
 
@@ -36,9 +40,11 @@ Structure your briefing in this exact order:
    • 🆕  New patients (first visit) — remind staff to have intake forms ready and give
          an especially warm welcome experience.
    • ⏱️  Tight back-to-back gaps (< 10 min) for the same provider — flag as potential
-         scheduling pressure points.
-   • 📋  Schedule gaps longer than 30 min — note as potential fill-in opportunities.
-   • 📅  Double-booked rooms or providers — flag immediately for resolution.
+         scheduling pressure points (see TIGHT TURNAROUNDS in the data).
+   • 📋  Schedule gaps longer than 30 min — note as potential fill-in opportunities
+         (see SCHEDULE GAPS in the data).
+   • 📅  Double-booked rooms — flag immediately for resolution
+         (see DOUBLE-BOOKED ROOMS in the data).
 
 4. CLOSING  — A brief, encouraging sign-off for the team.
 
@@ -47,32 +53,50 @@ Tone rules:
 - Use clear headings and bullet points so staff can scan in under 2 minutes.
 - If there are NO appointments today, deliver a brief upbeat message about the quiet day.
 - Do NOT invent information that was not provided.
+- Tight turnarounds, schedule gaps and double-booked rooms are precomputed in
+  the data from each appointment's booked time pattern — report those sections
+  as given rather than recalculating them.
 """
 
+# Returned without calling Claude when nothing is scheduled.
+_QUIET_DAY_MESSAGE = (
+    "Good morning! It's a quiet day — no appointments are scheduled. "
+    "A great chance to catch up on recalls, confirmations, and paperwork. "
+    "Have a wonderful day, team!"
+)
+
 # ---------------------------------------------------------------------------
 # Data formatting
 # ---------------------------------------------------------------------------
 
-_INVALID_BIRTHDATE_YEAR = 1900  # Open Dental stores unknown DOBs as 0001-01-01
+_MIN_VALID_BIRTHDATE = date(1900, 1, 1)  # Open Dental stores unknown DOBs as 0001-01-01
+_TIGHT_GAP = timedelta(minutes=10)
+_LONG_GAP = timedelta(minutes=30)
+_SLOT = timedelta(minutes=5)  # appointment.Pattern stores length in 5-minute slots
 
 
-def _phone_for_patient(apt: dict[str, Any]) -> str:
+def _phone_for_patient(apt: Appointment) -> str:
     """Return the best available phone number for a patient."""
     return (
-        apt.get("WirelessPhone")
-        or apt.get("HmPhone")
+        apt.WirelessPhone
+        or apt.HmPhone
         or "no phone on file"
     )
 
 
+def _fmt_time(dt: datetime) -> str:
+    """Format a datetime as '9:05 AM' — integer maths, no strftime/lstrip."""
+    hour = dt.hour
+    return f"{hour % 12 or 12}:{dt.minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
 def _is_valid_birthdate(bd: Any) -> bool:
-    """Return True if the birthdate looks like a real date (not OD's 0001-01-01 sentinel)."""
-    if bd is None:
-        return False
-    try:
-        return bd.year >= _INVALID_BIRTHDATE_YEAR
-    except AttributeError:
-        return False
+    """Return True if the birthdate looks like a real date (not OD's 0001-01-01 sentinel).
+
+    patient.Birthdate is a DATE column, so real values are always plain ``date``
+    objects; anything else (None, strings) is rejected without a try/except.
+    """
+    return type(bd) is date and bd >= _MIN_VALID_BIRTHDATE
 
 
 def _format_data_for_prompt(data: dict[str, Any]) -> str:
@@ -80,97 +104,223 @@ def _format_data_for_prompt(data: dict[str, Any]) -> str:
     Convert the appointment data dict into a structured plain-text block
     that Claude can easily reason over.
     """
-    appointments: list[dict[str, Any]] = data["appointments"]
+    appointments: list[Appointment] = data["appointments"]
     broken_history: dict[int, int] = data["broken_history"]
 
     today = date.today()
-    lines: list[str] = [
-        f"DATE: {today.strftime('%A, %B %d, %Y')}",
-        f"TOTAL SCHEDULED APPOINTMENTS: {len(appointments)}",
-        "",
-    ]
+    today_y, today_m, today_d = today.year, today.month, today.day
+    buf = io.StringIO()
+    w = buf.write
+    w(f"DATE: {today.strftime('%A, %B %d, %Y')}\n")
+    w(f"TOTAL SCHEDULED APPOINTMENTS: {len(appointments)}\n")
+    w("\n")
 
     if not appointments:
-        lines.append("No appointments are scheduled for today.")
-        return "\n".join(lines)
+        w("No appointments are scheduled for today.\n")
+        return buf.getvalue()
 
     # ------------------------------------------------------------------
     # Appointment list
     # ------------------------------------------------------------------
-    lines.append("APPOINTMENTS (chronological):")
-    lines.append("")
+    w("APPOINTMENTS (chronological):\n")
+    w("\n")
 
-    birthday_patients: list[dict[str, Any]] = []
+    birthday_patients: list[Appointment] = []
+    pat_name_map: dict[int, str] = {}
+    prov_name_map: dict[int, str] = {}
+    room_name_map: dict[int, str] = {}
 
-    for idx, apt in enumerate(appointments, start=1):
-        dt = apt["AptDateTime"]
-        time_str = dt.strftime("%I:%M %p").lstrip("0")
+    # Bind hot lookups to locals for the per-appointment loop
+    bh_get = broken_history.get
+    phone_for = _phone_for_patient
+    valid_bd = _is_valid_birthdate
 
-        pat_name = f"{apt.get('PatFName', '')} {apt.get('PatLName', '')}".strip()
-        prov_abbr = apt.get("ProvAbbr") or f"{apt.get('ProvFName', '')} {apt.get('ProvLName', '')}".strip()
-        prov_full = f"Dr. {apt.get('ProvFName', '')} {apt.get('ProvLName', '')} ({prov_abbr})".strip()
-        room = apt.get("OperatoryName") or f"Op {apt.get('OperatoryNum', '?')}"
-        procedure = apt.get("ProcDescript") or "Not specified"
-        phone = _phone_for_patient(apt)
+    for idx, apt in enumerate(appointments, start=1):
+        dt = apt.AptDateTime
+        time_str = _fmt_time(dt)
+
+        pat_name = f"{apt.PatFName or ''} {apt.PatLName or ''}".strip()
+        pat_name_map[apt.PatNum] = pat_name
+        fn = apt.ProvFName or ""
+        ln = apt.ProvLName or ""
+        prov_abbr = apt.ProvAbbr or f"{fn} {ln}".strip()
+        prov_full = f"Dr. {fn} {ln} ({prov_abbr})"
+        room = apt.OperatoryName or f"Op {apt.OperatoryNum or '?'}"
+        prov_name_map[apt.ProvNum] = prov_full
+        room_name_map[apt.OperatoryNum] = room
+        procedure = apt.ProcDescript or "Not specified"
+        phone = phone_for(apt)
 
         flags: list[str] = []
 
         # New patient — OpenDental's own IsNewPatient flag
-        if apt.get("IsNewPatient"):
+        if apt.IsNewPatient:
             flags.append("🆕 NEW PATIENT")
 
         # Broken history
-        missed = broken_history.get(apt["PatNum"], 0)
-        if missed >= 2:
+        missed = bh_get(apt.PatNum, 0)
+        if missed:
             flags.append(f"⚠️ {missed} broken appointments on record")
 
         # Birthday
-        bd = apt.get("Birthdate")
-        if _is_valid_birthdate(bd) and bd.month == today.month and bd.day == today.day:
+        bd = apt.Birthdate
+        if valid_bd(bd) and bd.month == today_m and bd.day == today_d:
             flags.append("🎂 BIRTHDAY TODAY")
             birthday_patients.append(apt)
 
-        lines.append(f"{idx}. {time_str} | {prov_full} | {room}")
-        lines.append(f"   Patient  : {pat_name}")
-        lines.append(f"   Procedure: {procedure}")
-        lines.append(f"   Phone    : {phone}")
+        w(f"{idx}. {time_str} | {prov_full} | {room}\n")
+        w(f"   Patient  : {pat_name}\n")
+        w(f"   Procedure: {procedure}\n")
+        w(f"   Phone    : {phone}\n")
         if flags:
-            lines.append(f"   Flags    : {' | '.join(flags)}")
-        lines.append("")
+            w(f"   Flags    : {' | '.join(flags)}\n")
+        w("\n")
 
     # ------------------------------------------------------------------
     # Summary sections (provide extra context for Claude's analysis)
     # ------------------------------------------------------------------
     if birthday_patients:
-        lines.append("BIRTHDAY PATIENTS TODAY:")
+        w("BIRTHDAY PATIENTS TODAY:\n")
         for apt in birthday_patients:
-            bd = apt["Birthdate"]
-            age = today.year - bd.year - ((today.month, today.day) < (bd.month, bd.day))
-            lines.append(f"  - {apt.get('PatFName', '')} {apt.get('PatLName', '')} (turning {age})")
-        lines.append("")
+            bd = apt.Birthdate
+            age = today_y - bd.year - ((today_m, today_d) < (bd.month, bd.day))
+            w(f"  - {apt.PatFName or ''} {apt.PatLName or ''} (turning {age})\n")
+        w("\n")
 
-    high_risk = [(pn, cnt) for pn, cnt in broken_history.items() if cnt >= 2]
+    high_risk = list(broken_history.items())  # db already filters to 2+ missed
     if high_risk:
-        pat_name_map = {
-            apt["PatNum"]: f"{apt.get('PatFName', '')} {apt.get('PatLName', '')}".strip()
-            for apt in appointments
-        }
-        lines.append("PATIENTS WITH BROKEN APPOINTMENT HISTORY (2+ missed):")
-        for pat_num, cnt in sorted(high_risk, key=lambda x: -x[1]):
+        w("PATIENTS WITH BROKEN APPOINTMENT HISTORY (2+ missed):\n")
+        for pat_num, cnt in sorted(high_risk, key=itemgetter(1), reverse=True):
             name = pat_name_map.get(pat_num, f"PatNum {pat_num}")
-            lines.append(f"  - {name}: {cnt} broken/missed appointments")
-        lines.append("")
+            w(f"  - {name}: {cnt} broken/missed appointments\n")
+        w("\n")
 
-    new_patient_apts = [apt for apt in appointments if apt.get("IsNewPatient")]
+    new_patient_apts = [apt for apt in appointments if apt.IsNewPatient]
     if new_patient_apts:
-        lines.append("NEW PATIENTS TODAY (first visit — IsNewPatient flag):")
+        w("NEW PATIENTS TODAY (first visit — IsNewPatient flag):\n")
         for apt in new_patient_apts:
-            name = f"{apt.get('PatFName', '')} {apt.get('PatLName', '')}".strip()
-            t = apt["AptDateTime"].strftime("%I:%M %p").lstrip("0")
-            lines.append(f"  - {name} at {t}")
-        lines.append("")
+            name = f"{apt.PatFName or ''} {apt.PatLName or ''}".strip()
+            t = _fmt_time(apt.AptDateTime)
+            w(f"  - {name} at {t}\n")
+        w("\n")
+
+    _write_schedule_pressure(w, appointments, pat_name_map, prov_name_map, room_name_map)
+
+    return buf.getvalue()
+
+
+def _room_span(apt: Appointment) -> tuple[datetime, datetime]:
+    """Chair time: the whole Pattern, one character per 5-minute slot."""
+    start = apt.AptDateTime
+    return start, start + len(apt.Pattern or "") * _SLOT
+
+
+def _provider_span(apt: Appointment) -> tuple[datetime, datetime] | None:
+    """Provider time: first to last ``X`` slot (``/`` is assistant-only time).
+
+    None when the Pattern has no provider slots. With no Pattern at all the
+    length is unknown, so the span is just the start time.
+    """
+    start = apt.AptDateTime
+    pattern = (apt.Pattern or "").upper()
+    if not pattern:
+        return start, start
+    first = pattern.find("X")
+    if first < 0:
+        return None
+    return start + first * _SLOT, start + (pattern.rfind("X") + 1) * _SLOT
+
 
-    return "\n".join(lines)
+def _sweep(spans: list[tuple[int, datetime, datetime, Appointment]]):
+    """
+    Walk ``(key, start, end, apt)`` spans in start order within each key,
+    yielding ``(key, prev, prev_end, start, nxt)`` where ``prev`` is the
+    earlier span that runs latest, so overlaps and gaps are judged against
+    the time the room or provider is actually busy until.
+    """
+    spans.sort(key=itemgetter(0, 1))
+    for key, group in groupby(spans, key=itemgetter(0)):
+        prev: Appointment | None = None
+        prev_end = datetime.min
+        for _, start, end, apt in group:
+            if prev is not None:
+                yield key, prev, prev_end, start, apt
+            if prev is None or end > prev_end:
+                prev, prev_end = apt, end
+
+
+def _write_schedule_pressure(
+    w: Any,
+    appointments: list[Appointment],
+    pat_names: dict[int, str],
+    prov_names: dict[int, str],
+    room_names: dict[int, str],
+) -> None:
+    """
+    Write the tight-turnaround, schedule-gap and double-booked-room sections,
+    computed here rather than left to Claude.
+
+    Rooms are busy for the whole Pattern. Providers are busy only for its
+    ``X`` slots, no gap is measured after an appointment with no Pattern,
+    and a hygiene visit (IsHygiene) is charged to the hygienist
+    (ProvHyg) rather than the dentist on appointment.ProvNum, so a hygiene
+    chair running alongside the dentist's own patient is not a conflict.
+    """
+    fmt = _fmt_time
+    tight: list[str] = []
+    gaps: list[str] = []
+    double: list[str] = []
+
+    rooms = [(a.OperatoryNum, *_room_span(a), a) for a in appointments]
+    for num, prev, prev_end, start, nxt in _sweep(rooms):
+        if start < prev_end or start == prev.AptDateTime:
+            booked = fmt(prev.AptDateTime) + (f"–{fmt(prev_end)}" if prev.Pattern else "")
+            double.append(
+                f"  - Room {room_names[num]}: {pat_names[prev.PatNum]} ({booked}) "
+                f"overlaps {pat_names[nxt.PatNum]} at {fmt(start)}\n"
+            )
+
+    names = dict(prov_names)
+    provs: list[tuple[int, datetime, datetime, Appointment]] = []
+    for a in appointments:
+        span = _provider_span(a)
+        if span is None:
+            continue
+        if a.IsHygiene and a.ProvHyg:
+            names.setdefault(a.ProvHyg, a.ProvHygAbbr or f"Hygienist #{a.ProvHyg}")
+            provs.append((a.ProvHyg, *span, a))
+        else:
+            provs.append((a.ProvNum, *span, a))
+    for num, prev, prev_end, start, nxt in _sweep(provs):
+        gap = start - prev_end
+        if not prev.Pattern or gap < timedelta(0):
+            continue  # unknown length, or overlapping provider slots — no gap to report
+        mins = int(gap.total_seconds() // 60)
+        if gap < _TIGHT_GAP:
+            tight.append(
+                f"  - {names[num]}: {pat_names[prev.PatNum]} done {fmt(prev_end)} → "
+                f"{pat_names[nxt.PatNum]} needed {fmt(start)} ({mins} min)\n"
+            )
+        elif gap > _LONG_GAP:
+            gaps.append(f"  - {names[num]}: free {fmt(prev_end)}–{fmt(start)} ({mins} min)\n")
+
+    if tight:
+        w("TIGHT TURNAROUNDS (same provider, < 10 min between their time in consecutive appointments):\n")
+        for line in tight:
+            w(line)
+        w("\n")
+
+    if gaps:
+        w("SCHEDULE GAPS (same provider, > 30 min free between appointments):\n")
+        for line in gaps:
+            w(line)
+        w("\n")
+
+    if double:
+        w("DOUBLE-BOOKED ROOMS (same room, overlapping times):\n")
+        for line in double:
+            w(line)
+        w("\n")
 
 
 # ---------------------------------------------------------------------------
@@ -182,12 +332,26 @@ def generate_briefing(data: dict[str, Any]) -> str:
     Send appointment data to Claude and stream the briefing to the terminal.
 
     Returns the complete briefing text as a string so the caller can save it.
+    An empty schedule returns a canned quiet-day message without calling the API.
     """
+    if not data["appointments"]:
+        logger.info("No appointments scheduled — skipping Claude API call")
+        print()
+        print(_QUIET_DAY_MESSAGE)
+        return _QUIET_DAY_MESSAGE
+
+    import anthropic  # deferred: pulls in httpx/pydantic, unneeded for prompt formatting
+
     user_content = _format_data_for_prompt(data)
     logger.info("Sending appointment data to Claude (model: claude-opus-4-6)")
 
     client = anthropic.Anthropic()
-    text_chunks: list[str] = []
+    buf = io.StringIO()
+
+    # Flush every 16 deltas or at a line break rather than on every token.
+    write = sys.stdout.write
+    flush = sys.stdout.flush
+    counter = 0
 
     print()  # blank line before briefing
     try:
@@ -198,13 +362,15 @@ def generate_briefing(data: dict[str, Any]) -> str:
             system=_SYSTEM_PROMPT,
             messages=[{"role": "user", "content": user_content}],
         ) as stream:
-            for event in stream:
-                if event.type == "content_block_delta":
-                    # Adaptive thinking produces thinking_delta blocks — skip those;
-                    # only stream the text_delta blocks to the terminal.
-                    if event.delta.type == "text_delta":
-                        print(event.delta.text, end="", flush=True)
-                        text_chunks.append(event.delta.text)
+            # text_stream yields only text_delta content — the thinking_delta
+            # blocks produced by adaptive thinking are skipped by the SDK.
+            for text in stream.text_stream:
+                write(text)
+                buf.write(text)
+                counter += 1
+                if counter & 15 == 0 or "\n" in text:
+                    flush()
+            flush()
 
             final = stream.get_final_message()
             logger.info(
@@ -223,4 +389,4 @@ def generate_briefing(data: dict[str, Any]) -> str:
         raise RuntimeError(f"Anthropic API error ({exc.status_code}): {exc.message}") from exc
 
     print()  # newline after streamed content
-    return "".join(text_chunks)
+    return buf.getvalue()
@@ -1,28 +1,42 @@
 """
 db.py — MySQL database connection and query module for Open Dental appointments.
+
+mysql.connector is imported inside the functions that need it, so importing
+this module does not pay the connector's import cost until a query runs.
 """
+from __future__ import annotations
+
 import os
 import logging
+import threading
+from collections import namedtuple
 from datetime import date
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import mysql.connector
-from mysql.connector import Error
+if TYPE_CHECKING:
+    from mysql.connector import pooling
 
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # SQL queries  (MySQL 5.6 syntax, %s placeholders)
+#
+# Date filters compare AptDateTime against half-open [day, day + 1) bounds
+# rather than wrapping it in DATE(), so MySQL can range-scan its index.
 # ---------------------------------------------------------------------------
 
-_APPOINTMENTS_QUERY = """
+# Columns and joins shared by every appointment query; callers append WHERE/ORDER BY.
+_APPOINTMENT_SELECT = """
     SELECT
         a.AptNum,
         a.AptDateTime,
         a.PatNum,
         a.ProvNum,
+        a.ProvHyg,
+        a.IsHygiene,
         a.AptStatus,
         a.ProcDescript,
+        a.Pattern,
         a.IsNewPatient,
         a.Note,
         a.ClinicNum,
@@ -36,80 +50,165 @@ _APPOINTMENTS_QUERY = """
         pr.FName         AS ProvFName,
         pr.LName         AS ProvLName,
         pr.Abbr          AS ProvAbbr,
-        o.OpName         AS OperatoryName
+        ph.Abbr          AS ProvHygAbbr,
+        o.OpName         AS OperatoryName,
+        (
+            SELECT COUNT(*)
+            FROM   appointment b
+            WHERE  b.AptStatus = 5
+              AND  b.PatNum    = a.PatNum
+        )                AS BrokenCount
     FROM       appointment a
     LEFT JOIN  patient    p  ON a.PatNum  = p.PatNum
     LEFT JOIN  provider   pr ON a.ProvNum = pr.ProvNum
+    LEFT JOIN  provider   ph ON a.ProvHyg = ph.ProvNum
     LEFT JOIN  operatory  o  ON a.Op      = o.OperatoryNum
-    WHERE DATE(a.AptDateTime) = CURDATE()
+"""
+
+_APPOINTMENTS_QUERY = _APPOINTMENT_SELECT + """
+    WHERE a.AptDateTime >= CURDATE()
+      AND a.AptDateTime <  CURDATE() + INTERVAL 1 DAY
       AND a.AptStatus = 1
     ORDER BY a.AptDateTime ASC, a.Op ASC
 """
 
-_APPOINTMENTS_FOR_DATE_QUERY = """
-    SELECT
-        a.AptNum,
-        a.AptDateTime,
-        a.PatNum,
-        a.ProvNum,
-        a.AptStatus,
-        a.ProcDescript,
-        a.IsNewPatient,
-        a.Note,
-        a.ClinicNum,
-        a.Op             AS OperatoryNum,
-        p.FName          AS PatFName,
-        p.LName          AS PatLName,
-        p.HmPhone,
-        p.WirelessPhone,
-        p.Birthdate,
-        p.Email,
-        pr.FName         AS ProvFName,
-        pr.LName         AS ProvLName,
-        pr.Abbr          AS ProvAbbr,
-        o.OpName         AS OperatoryName
-    FROM       appointment a
-    LEFT JOIN  patient    p  ON a.PatNum  = p.PatNum
-    LEFT JOIN  provider   pr ON a.ProvNum = pr.ProvNum
-    LEFT JOIN  operatory  o  ON a.Op      = o.OperatoryNum
-    WHERE DATE(a.AptDateTime) = %s
+_APPOINTMENTS_FOR_DATE_QUERY = _APPOINTMENT_SELECT + """
+    WHERE a.AptDateTime >= %s
+      AND a.AptDateTime <  %s + INTERVAL 1 DAY
       AND a.AptStatus = 1
     ORDER BY a.AptDateTime ASC, a.Op ASC
 """
 
-_BROKEN_HISTORY_QUERY = """
-    SELECT PatNum, COUNT(*) AS missed_count
-    FROM   appointment
-    WHERE  AptStatus = 5
-      AND  PatNum IN ({placeholders})
-    GROUP BY PatNum
-"""
+
+# One scheduled appointment row. Field order matches the SELECT list of the
+# appointment queries above, so tuple-cursor rows map straight onto it.
+Appointment = namedtuple(
+    "Appointment",
+    "AptNum AptDateTime PatNum ProvNum ProvHyg IsHygiene AptStatus ProcDescript Pattern "
+    "IsNewPatient Note ClinicNum OperatoryNum PatFName PatLName HmPhone WirelessPhone "
+    "Birthdate Email ProvFName ProvLName ProvAbbr ProvHygAbbr OperatoryName BrokenCount",
+)
 
 
 # ---------------------------------------------------------------------------
 # Connection
 # ---------------------------------------------------------------------------
 
-def _get_connection() -> mysql.connector.connection.MySQLConnection:
-    """Create a MySQL connection from environment variables."""
+_POOL_NAME = "od"
+_POOL_SIZE = 8  # upper bound; connections are opened only as demand requires
+
+_POOL: pooling.MySQLConnectionPool | None = None
+_POOL_OPENED = 0  # connections created so far, <= _POOL_SIZE
+_POOL_LOCK = threading.Lock()
+
+
+def _connect_config() -> dict[str, Any]:
+    """Connection arguments from environment variables (KeyError if one is missing).
+
+    ``autocommit=True`` ends each SELECT's implicit transaction, so a reused
+    connection never sits on a stale REPEATABLE READ snapshot. Uses the C
+    extension (``use_pure=False``) for faster wire decoding when installed.
+    """
+    from mysql.connector import HAVE_CEXT
+
+    return dict(
+        host=os.environ["DB_HOST"],
+        port=int(os.environ.get("DB_PORT", "3306")),
+        user=os.environ["DB_USER"],
+        password=os.environ.get("DB_PASSWORD", ""),
+        database=os.environ["DB_NAME"],
+        connect_timeout=10,
+        charset="utf8",
+        use_unicode=True,
+        autocommit=True,
+        use_pure=not HAVE_CEXT,
+    )
+
+
+def _create_pool() -> pooling.MySQLConnectionPool:
+    """Build an empty, configured connection pool.
+
+    Connections are added by get_connection() on demand, so a one-shot CLI
+    run opens a single connection while the Flask server grows to what its
+    concurrency needs. With autocommit on there is no open transaction or
+    session state to clear, so ``pool_reset_session=False`` skips the reset
+    round trip on every return to the pool.
+    """
+    from mysql.connector import pooling
+
+    config = _connect_config()
+    if config["use_pure"]:
+        logger.info("MySQL C extension not available — using pure-Python connector")
+    pool = pooling.MySQLConnectionPool(
+        pool_name=_POOL_NAME, pool_size=_POOL_SIZE, pool_reset_session=False
+    )
+    pool.set_config(**config)
+    logger.info(
+        "MySQL connection pool configured: %s@%s/%s (up to %d)",
+        config["user"],
+        config["host"],
+        config["database"],
+        _POOL_SIZE,
+    )
+    return pool
+
+
+def get_pool() -> pooling.MySQLConnectionPool:
+    """Return the shared connection pool, creating it on first use.
+
+    Every caller — the Flask blueprints, main.py and test_db.py — checks out
+    connections through get_connection(), so importing this module never
+    touches the database.
+
+    Raises:
+        RuntimeError: If a required env var is missing or the config is invalid.
+    """
+    from mysql.connector import Error
+
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                try:
+                    _POOL = _create_pool()
+                except KeyError as exc:
+                    raise RuntimeError(f"Missing required environment variable: {exc}") from exc
+                except Error as exc:
+                    raise RuntimeError(f"Failed to connect to MySQL: {exc}") from exc
+    return _POOL
+
+
+def get_connection() -> Any:
+    """Check out a MySQL connection; ``close()`` hands it back.
+
+    Takes an idle pooled connection, opens a new pooled one while fewer than
+    _POOL_SIZE exist, and otherwise falls back to a one-off connection (closed
+    for real on ``close()``) so a burst of requests waits on a handshake
+    rather than failing.
+
+    Raises:
+        RuntimeError: If a required env var is missing or MySQL is unreachable.
+    """
+    from mysql.connector import Error, PoolError, connect
+
+    global _POOL_OPENED
+    pool = get_pool()
     try:
-        conn = mysql.connector.connect(
-            host=os.environ["DB_HOST"],
-            port=int(os.environ.get("DB_PORT", "3306")),
-            user=os.environ["DB_USER"],
-            password=os.environ.get("DB_PASSWORD", ""),
-            database=os.environ["DB_NAME"],
-            connect_timeout=10,
-            charset="utf8",
-            use_unicode=True,
-        )
-        logger.info(
-            "MySQL connection established: %s@%s/%s",
-            os.environ["DB_USER"],
-            os.environ["DB_HOST"],
-            os.environ["DB_NAME"],
-        )
-        return conn
+        try:
+            return pool.get_connection()
+        except PoolError:
+            pass  # no idle connection
+        with _POOL_LOCK:
+            grow = _POOL_OPENED < _POOL_SIZE
+            if grow:
+                pool.add_connection()
+                _POOL_OPENED += 1
+        if grow:
+            try:
+                return pool.get_connection()
+            except PoolError:
+                pass  # another thread took the new connection first
+        return connect(**_connect_config())
     except KeyError as exc:
         raise RuntimeError(f"Missing required environment variable: {exc}") from exc
     except Error as exc:
@@ -120,44 +219,32 @@ def _get_connection() -> mysql.connector.connection.MySQLConnection:
 # Query helpers
 # ---------------------------------------------------------------------------
 
-def _rows_to_dicts(cursor: Any) -> list[dict[str, Any]]:
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-
 def _fetch_appointments(
     cursor: Any,
     target_date: date | None = None,
-) -> list[dict[str, Any]]:
-    """Fetch scheduled (AptStatus=1) appointments — today or a given date."""
+) -> list[Appointment]:
+    """Fetch scheduled (AptStatus=1) appointments — today or a given date.
+
+    Expects a plain tuple cursor (``conn.cursor()``).
+    """
     if target_date is None:
         cursor.execute(_APPOINTMENTS_QUERY)
     else:
-        cursor.execute(_APPOINTMENTS_FOR_DATE_QUERY, (target_date.isoformat(),))
-    appointments = _rows_to_dicts(cursor)
+        cursor.execute(_APPOINTMENTS_FOR_DATE_QUERY, (target_date, target_date))
+    appointments = [Appointment._make(row) for row in cursor.fetchall()]
     logger.info("Fetched %d appointments", len(appointments))
     return appointments
 
 
-def _fetch_broken_history(cursor: Any, patient_nums: list[int]) -> dict[int, int]:
-    """Return {PatNum: missed_count} for all patients, including those with 0 history."""
-    if not patient_nums:
-        return {}
-    placeholders = ",".join(["%s"] * len(patient_nums))
-    cursor.execute(
-        _BROKEN_HISTORY_QUERY.format(placeholders=placeholders),
-        patient_nums,
-    )
-    return {row[0]: row[1] for row in cursor.fetchall()}
-
-
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
 def get_patient_photo_file(pat_num: int) -> str | None:
     """Return FileName of most recent patient photo doc, or None if no photo."""
-    conn = _get_connection()
+    from mysql.connector import Error
+
+    conn = get_connection()
     try:
         cursor = conn.cursor()
         cursor.execute(
@@ -183,7 +270,9 @@ def get_last_visits(patient_nums: list[int]) -> dict[int, Any]:
     """Return {PatNum: last_completed_datetime} for patients' most recent completed visit."""
     if not patient_nums:
         return {}
-    conn = _get_connection()
+    from mysql.connector import Error
+
+    conn = get_connection()
     try:
         cursor = conn.cursor()
         placeholders = ",".join(["%s"] * len(patient_nums))
@@ -193,7 +282,7 @@ def get_last_visits(patient_nums: list[int]) -> dict[int, Any]:
             FROM   appointment
             WHERE  PatNum IN ({placeholders})
               AND  AptStatus = 2
-              AND  DATE(AptDateTime) < CURDATE()
+              AND  AptDateTime < CURDATE()
             GROUP BY PatNum
             """,
             patient_nums,
@@ -205,21 +294,61 @@ def get_last_visits(patient_nums: list[int]) -> dict[int, Any]:
         conn.close()
 
 
+def get_month_counts(year: int, month: int) -> dict[str, int]:
+    """Return {"YYYY-MM-DD": scheduled_count} for every day in a month with appointments.
+
+    Raises ValueError for an out-of-range year/month.
+    """
+    from mysql.connector import Error
+
+    start = date(year, month, 1)
+    end = date(year + (month == 12), month % 12 + 1, 1)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT DATE(AptDateTime) AS d, COUNT(*) AS cnt
+            FROM   appointment
+            WHERE  AptStatus = 1
+              AND  AptDateTime >= %s
+              AND  AptDateTime <  %s
+            GROUP BY DATE(AptDateTime)
+            """,
+            (start, end),
+        )
+        return {str(row[0]): row[1] for row in cursor.fetchall()}
+    except Error as exc:
+        raise RuntimeError(f"Database query failed: {exc}") from exc
+    finally:
+        conn.close()
+
+
 def get_appointment_data(target_date: date | None = None) -> dict[str, Any]:
     """
     Connect and return:
-      appointments   — list[dict]  scheduled appointments (AptStatus=1), with all fields
+      appointments   — list[Appointment]  scheduled appointments (AptStatus=1), with all fields
       broken_history — dict[int,int]  PatNum → missed/broken appointment count
+                       (only patients with 2+ on record are included)
+
+    Broken history comes back on each appointment row (BrokenCount, a
+    correlated count that probes ix_appt_status_pat once per row), so both
+    are fetched in one round-trip.
 
     Note: new patient detection uses appointment.IsNewPatient (1/0) directly from
     Open Dental — no subquery needed.
     """
-    conn = _get_connection()
+    from mysql.connector import Error
+
+    conn = get_connection()
     try:
         cursor = conn.cursor()
         appointments = _fetch_appointments(cursor, target_date)
-        patient_nums = [apt["PatNum"] for apt in appointments]
-        broken_history = _fetch_broken_history(cursor, patient_nums)
+        broken_history = {
+            apt.PatNum: apt.BrokenCount
+            for apt in appointments
+            if apt.BrokenCount >= 2
+        }
         return {
             "appointments": appointments,
             "broken_history": broken_history,
@@ -228,4 +357,4 @@ def get_appointment_data(target_date: date | None = None) -> dict[str, Any]:
         raise RuntimeError(f"Database query failed: {exc}") from exc
     finally:
         conn.close()
-        logger.info("MySQL connection closed")
+        logger.info("MySQL connection released")
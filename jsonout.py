@@ -0,0 +1,35 @@
+"""
+jsonout.py — JSON serialisation shared by main.py, server.py and test_db.py.
+
+Uses orjson when it is installed and falls back to the standard library json
+module otherwise, so every entry point renders the same types the same way.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson  # optional — faster JSON with native date/datetime support
+except ImportError:
+    orjson = None
+
+
+def _json_default(obj: Any) -> str:
+    """Make datetime / date objects (and anything else unknown) JSON-serialisable."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(obj: Any, *, indent: bool = False) -> bytes:
+    """Serialise obj to UTF-8 JSON bytes; ``indent=True`` pretty-prints with 2 spaces.
+
+    Integer dict keys (e.g. broken_history's PatNums) become strings either way.
+    """
+    if orjson is not None:
+        # default= is only consulted for types orjson can't encode natively
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=_json_default, option=option)
+    return json.dumps(
+        obj, indent=2 if indent else None, default=_json_default, ensure_ascii=False
+    ).encode()
@@ -8,19 +8,18 @@ Usage:
     python main.py --briefing --date 2026-02-20  # AI briefing for a specific date
 """
 import argparse
-import json
 import logging
 import os
 import sys
 from datetime import date, datetime
 from pathlib import Path
-from typing import Any
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 import db
+import jsonout
 
 # ---------------------------------------------------------------------------
 # Constants
@@ -90,12 +89,6 @@ def _print_footer(saved_to: Path) -> None:
     print("-" * 60 + "\n")
 
 
-def _json_default(obj: Any) -> str:
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    return str(obj)
-
-
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
@@ -144,10 +137,10 @@ def main() -> None:
         output = {
             "date": target_date.isoformat(),
             "appointment_count": len(data["appointments"]),
-            "appointments": data["appointments"],
+            "appointments": [apt._asdict() for apt in data["appointments"]],
             "broken_history": data["broken_history"],
         }
-        print(json.dumps(output, indent=2, default=_json_default, ensure_ascii=False))
+        sys.stdout.buffer.write(jsonout.dumps(output, indent=True) + b"\n")
         return
 
     # --briefing mode: call Claude AI
@@ -10,18 +10,40 @@ Only patient-safe fields returned — no phone, no missed history, no notes.
 """
 import os
 import re
+import threading
+import time
+from collections import defaultdict
 from datetime import date, datetime
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
-from flask import Blueprint, jsonify, render_template, request, send_file
+from flask import Blueprint, current_app, jsonify, render_template, request, send_file
 
 import db
 
 # Network path to Open Dental image store (set in .env)
 _IMAGE_ROOT = Path(os.environ.get("OPENDENT_IMAGE_PATH", r"\\10.0.0.83\OpenDentImages"))
 
+# /photo-debug lists patient-named folders, so it is off unless enabled in .env
+_PHOTO_DEBUG = os.environ.get("KIOSK_PHOTO_DEBUG", "").lower() in ("1", "true", "yes")
+
 kiosk_bp = Blueprint("kiosk", __name__, url_prefix="/kiosk")
 
+# Today's appointments are shared by all kiosk searches for this many seconds,
+# so a burst of check-ins costs one DB round trip instead of one per search.
+_APT_CACHE_TTL = 30.0
+_APT_CACHE: dict[date, tuple[float, dict]] = {}
+_APT_CACHE_LOCK = threading.Lock()
+# After a failed refresh, searches answer db_unavailable for this many seconds
+# instead of each waiting out its own connect timeout behind the lock.
+_APT_FAIL_TTL = 5.0
+_APT_RETRY_AT = 0.0  # monotonic time before which no refresh is attempted
+
+_DEBUG_LIST_LIMIT = 50  # max directory entries returned by /photo-debug
+_LNAME_KEY_LEN    = 2  # last-name index bucket = first N lowercase letters
+_PHONE_MIN_DIGITS = 7  # shortest phone search accepted; also the index key length
+
 # ---------------------------------------------------------------------------
 # Procedure code → plain-English mapping
 # ---------------------------------------------------------------------------
@@ -53,9 +75,34 @@ _PROC_MAP = [
     ("Ven",          "Veneer"),
 ]
 
-_NON_PERSON = {"PC", "LLC", "INC", "GROUP", "DENTAL", "ASSOCIATES", "CARE"}
+_NON_PERSON = frozenset({"PC", "LLC", "INC", "GROUP", "DENTAL", "ASSOCIATES", "CARE"})
+_NON_PERSON_RE = re.compile(r"\b(?:" + "|".join(sorted(_NON_PERSON)) + r")\b", re.IGNORECASE)
+
+_EXT_RE             = re.compile(r"\.\w+$")
+_TRAILING_DIGITS_RE = re.compile(r"\d+$")
+
+
+class _DigitsOnlyTable(dict):
+    """str.translate table that keeps decimal digits and deletes everything else.
+
+    Filled lazily per code point, so it only ever holds the few characters
+    phone numbers actually use; after first sight each lookup stays in C.
+    """
+
+    def __missing__(self, cp: int) -> int | None:
+        keep = cp if chr(cp).isdecimal() else None
+        self[cp] = keep
+        return keep
+
 
+_DIGITS_ONLY = _DigitsOnlyTable()
 
+
+# Keys lowercased once; tested in list order, so the first entry found wins.
+_PROC_KEYS = tuple((k.lower(), v) for k, v in _PROC_MAP)
+
+
+@lru_cache(maxsize=1024)
 def _simplify_proc(raw: str) -> str:
     if not raw:
         return "Dental Visit"
@@ -63,19 +110,19 @@ def _simplify_proc(raw: str) -> str:
     labels: list[str] = []
     for part in [p.strip().lstrip("#") for p in raw.split(",")]:
         code = part.split("-", 1)[-1] if "-" in part else part
-        mapped = next((v for k, v in _PROC_MAP if k.lower() in code.lower()), None)
-        label = mapped or "Dental Visit"
+        code = code.lower()
+        label = next((v for k, v in _PROC_KEYS if k in code), "Dental Visit")
         if label not in seen:
             seen.add(label)
             labels.append(label)
     return ", ".join(labels) or "Dental Visit"
 
 
-def _provider_name(apt: dict) -> str:
-    fname = (apt.get("ProvFName") or "").strip()
-    lname = (apt.get("ProvLName") or "").strip()
-    abbr  = (apt.get("ProvAbbr")  or "").strip()
-    if not any(tok in lname.upper() for tok in _NON_PERSON) and fname and lname:
+def _provider_name(apt: db.Appointment) -> str:
+    fname = (apt.ProvFName or "").strip()
+    lname = (apt.ProvLName or "").strip()
+    abbr  = (apt.ProvAbbr  or "").strip()
+    if fname and lname and not _NON_PERSON_RE.search(lname):
         return f"Dr. {fname} {lname}"
     if abbr.lower().startswith("dr"):
         return abbr
@@ -92,27 +139,138 @@ def _fmt_date(d) -> str | None:
         return str(d)
 
 
-def _safe_fields(apt: dict, last_visit: str | None = None) -> dict:
+def _safe_fields(apt: db.Appointment, last_visit: str | None = None) -> dict:
     """Return only patient-appropriate fields."""
-    dt = apt.get("AptDateTime")
+    dt = apt.AptDateTime
     if isinstance(dt, str):
         dt = datetime.fromisoformat(dt)
     time_str = dt.strftime("%I:%M %p").lstrip("0") if dt else ""
 
     return {
-        "pat_num":    apt.get("PatNum"),           # needed for photo URL
-        "PatFName":   apt.get("PatFName", ""),
-        "PatLName":   apt.get("PatLName", ""),
+        "pat_num":    apt.PatNum,                  # needed for photo URL
+        "PatFName":   apt.PatFName or "",
+        "PatLName":   apt.PatLName or "",
         "time":       time_str,
         "provider":   _provider_name(apt),
-        "room":       apt.get("OperatoryName") or "",
-        "procedure":  _simplify_proc(apt.get("ProcDescript", "")),
+        "room":       apt.OperatoryName or "",
+        "procedure":  _simplify_proc(apt.ProcDescript or ""),
         "last_visit": last_visit,  # None → "First visit" shown in frontend
     }
 
 
+def _build_day_index(apts: list, last_visits: dict) -> dict:
+    """Index today's appointments once so each search reads a single bucket.
+
+    last_visits — {PatNum: last completed visit} for everyone booked today
+    by_lname — first _LNAME_KEY_LEN chars of the lowercased last name
+    by_dob   — valid birthdate (OD's pre-1900 "unknown" sentinel is skipped)
+    by_phone — last _PHONE_MIN_DIGITS digits of either phone number
+    Buckets keep the original (chronological) appointment order.
+    """
+    by_lname: defaultdict[str, list] = defaultdict(list)
+    by_dob: defaultdict[date, list] = defaultdict(list)
+    by_phone: defaultdict[str, list] = defaultdict(list)
+
+    for a in apts:
+        by_lname[(a.PatLName or "").lower()[:_LNAME_KEY_LEN]].append(a)
+
+        bd = a.Birthdate
+        if bd is not None and not (hasattr(bd, "year") and bd.year < 1900):
+            if hasattr(bd, "date"):
+                bd = bd.date()
+            by_dob[bd].append(a)
+
+        keys = {
+            digits[-_PHONE_MIN_DIGITS:]
+            for digits in (_only_digits(a.WirelessPhone), _only_digits(a.HmPhone))
+            if len(digits) >= _PHONE_MIN_DIGITS
+        }
+        for key in keys:
+            by_phone[key].append(a)
+
+    return {
+        "apts": apts,
+        "last_visits": last_visits,
+        "by_lname": by_lname,
+        "by_dob": by_dob,
+        "by_phone": by_phone,
+    }
+
+
+def _todays_index() -> dict:
+    """Return today's indexed appointments, cached for _APT_CACHE_TTL seconds.
+
+    The lock is held across the refresh so concurrent searches wait for one
+    fetch rather than each querying MySQL. A failed refresh is remembered for
+    _APT_FAIL_TTL seconds, so searches queued behind it fail fast. Raises
+    RuntimeError like the db call.
+    """
+    global _APT_RETRY_AT
+    today = date.today()
+    with _APT_CACHE_LOCK:
+        now = time.monotonic()
+        entry = _APT_CACHE.get(today)
+        if entry is not None and now - entry[0] < _APT_CACHE_TTL:
+            return entry[1]
+        if now < _APT_RETRY_AT:
+            raise RuntimeError("MySQL unavailable — last refresh failed")
+        try:
+            data = db.get_appointment_data(today)
+        except RuntimeError:
+            _APT_RETRY_AT = time.monotonic() + _APT_FAIL_TTL
+            raise
+        apts = data["appointments"]
+        try:
+            last_visits = db.get_last_visits(list({a.PatNum for a in apts}))
+        except RuntimeError:
+            last_visits = {}   # graceful degradation
+        index = _build_day_index(apts, last_visits)
+        _APT_CACHE.clear()  # drop earlier days
+        _APT_CACHE[today] = (time.monotonic(), index)
+        return index
+
+
 def _only_digits(s: str) -> str:
-    return re.sub(r"\D", "", s or "")
+    return (s or "").translate(_DIGITS_ONLY)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_photo(filename: str) -> Path:
+    """Locate a photo file in the image store.
+
+    Cached by filename: each probe is an SMB round trip, and a new photo gets
+    a new document filename, so a stale entry cannot outlive a photo change.
+    A missing file raises FileNotFoundError, which lru_cache does not store,
+    so photos that appear on the share later are still found. A cached path
+    that stops opening is evicted by the photo route.
+    """
+    # Derive folder from filename: strip extension, then trailing digits
+    # e.g. "GarciaBenjamin15388.jpg" → folder "GarciaBenjamin"
+    name_part = _EXT_RE.sub("", filename)                # → "GarciaBenjamin15388"
+    folder    = _TRAILING_DIGITS_RE.sub("", name_part)   # → "GarciaBenjamin"
+    letter    = folder[0].upper() if folder else "_"     # → "G"
+
+    # Try both layouts Open Dental uses
+    image_path = _IMAGE_ROOT / letter / folder / filename
+    if not image_path.exists():
+        image_path = _IMAGE_ROOT / "A to Z Folders" / folder / filename
+
+    if not image_path.exists():
+        raise FileNotFoundError(filename)
+    return image_path
+
+
+def _list_dir(path: Path, limit: int = _DEBUG_LIST_LIMIT) -> list[str] | str:
+    """First `limit` entry names in a directory, or the error text.
+
+    os.scandir gets names from the directory read itself (no per-entry stat
+    over SMB), and islice stops the walk early on huge patient folders.
+    """
+    try:
+        with os.scandir(path) as it:
+            return [entry.name for entry in islice(it, limit)]
+    except Exception as e:
+        return str(e)
 
 
 # ---------------------------------------------------------------------------
@@ -128,22 +286,16 @@ def index():
 
 @kiosk_bp.route("/photo-debug")
 def photo_debug():
-    import os
+    # Lists patient folders on the SMB share — debug server or KIOSK_PHOTO_DEBUG only.
+    if not (current_app.debug or _PHOTO_DEBUG):
+        return jsonify({"error": "disabled"}), 403
+
     filename  = "GarciaBenjamin15388.jpg"
     folder    = "GarciaBenjamin"
     letter    = "G"
-    try:
-        root_ls   = os.listdir(str(_IMAGE_ROOT))
-    except Exception as e:
-        root_ls = str(e)
-    try:
-        letter_ls = os.listdir(str(_IMAGE_ROOT / letter))
-    except Exception as e:
-        letter_ls = str(e)
-    try:
-        pat_ls = os.listdir(str(_IMAGE_ROOT / letter / folder))
-    except Exception as e:
-        pat_ls = str(e)
+    root_ls   = _list_dir(_IMAGE_ROOT)
+    letter_ls = _list_dir(_IMAGE_ROOT / letter)
+    pat_ls    = _list_dir(_IMAGE_ROOT / letter / folder)
     p1 = _IMAGE_ROOT / letter / folder / filename
     p2 = _IMAGE_ROOT / "A to Z Folders" / folder / filename
     return jsonify({
@@ -168,25 +320,23 @@ def patient_photo(pat_num):
     if not filename:
         return "", 404
 
-    # Derive folder from filename: strip extension, then trailing digits
-    # e.g. "GarciaBenjamin15388.jpg" → folder "GarciaBenjamin"
-    name_part = re.sub(r"\.\w+$", "", filename)          # → "GarciaBenjamin15388"
-    folder    = re.sub(r"\d+$",   "", name_part)         # → "GarciaBenjamin"
-    letter    = folder[0].upper() if folder else "_"     # → "G"
-
-    # Try both layouts Open Dental uses
-    image_path = _IMAGE_ROOT / letter / folder / filename
-    if not image_path.exists():
-        image_path = _IMAGE_ROOT / "A to Z Folders" / folder / filename
-
-    if not image_path.exists():
+    try:
+        image_path = _resolve_photo(filename)
+    except FileNotFoundError:
         return "", 404
 
     ext  = filename.rsplit(".", 1)[-1].lower()
     mime = {"jpg": "image/jpeg", "jpeg": "image/jpeg",
             "png": "image/png",  "gif":  "image/gif"}.get(ext, "image/jpeg")
 
-    return send_file(image_path, mimetype=mime)
+    # conditional=True answers If-None-Match / If-Modified-Since with a 304
+    try:
+        return send_file(image_path, mimetype=mime, conditional=True, max_age=3600)
+    except OSError:
+        # File moved or the share dropped out — forget cached paths (lru_cache
+        # has no per-key eviction) and answer like a missing photo.
+        _resolve_photo.cache_clear()
+        return "", 404
 
 
 @kiosk_bp.route("/search")
@@ -199,16 +349,18 @@ def search():
         return jsonify({"error": "Provide q, dob, or phone"}), 400
 
     try:
-        data = db.get_appointment_data(date.today())
+        day = _todays_index()
     except RuntimeError:
         return jsonify({"error": "db_unavailable"}), 500
 
-    apts = data["appointments"]
-
     # ── Filter by chosen search method ──
     if q:
         q_lower = q.lower()
-        matches = [a for a in apts if a.get("PatLName", "").lower().startswith(q_lower)]
+        if len(q_lower) >= _LNAME_KEY_LEN:
+            candidates = day["by_lname"].get(q_lower[:_LNAME_KEY_LEN], [])
+        else:
+            candidates = day["apts"]
+        matches = [a for a in candidates if (a.PatLName or "").lower().startswith(q_lower)]
 
     elif dob:
         try:
@@ -219,38 +371,23 @@ def search():
         except (ValueError, IndexError):
             return jsonify({"error": "dob_invalid"}), 400
 
-        matches = []
-        for a in apts:
-            bd = a.get("Birthdate")
-            if bd is None:
-                continue
-            if hasattr(bd, "year") and bd.year < 1900:
-                continue
-            if hasattr(bd, "date"):
-                bd = bd.date()
-            if bd == dob_date:
-                matches.append(a)
+        matches = day["by_dob"].get(dob_date, [])
 
     else:  # phone
         digits = _only_digits(phone)
-        if len(digits) < 7:
+        if len(digits) < _PHONE_MIN_DIGITS:
             return jsonify({"error": "phone_short"}), 400
 
         matches = [
-            a for a in apts
-            if _only_digits(a.get("WirelessPhone", "")).endswith(digits)
-            or _only_digits(a.get("HmPhone", "")).endswith(digits)
+            a for a in day["by_phone"].get(digits[-_PHONE_MIN_DIGITS:], [])
+            if _only_digits(a.WirelessPhone).endswith(digits)
+            or _only_digits(a.HmPhone).endswith(digits)
         ]
 
-    # ── Fetch last completed visit for each matched patient ──
-    pat_nums = list({a["PatNum"] for a in matches})
-    try:
-        last_visits = db.get_last_visits(pat_nums)
-    except RuntimeError:
-        last_visits = {}   # graceful degradation
-
+    # ── Last completed visit — fetched for all of today's patients at refresh ──
+    last_visits = day["last_visits"]
     results = [
-        _safe_fields(a, last_visit=_fmt_date(last_visits.get(a["PatNum"])))
+        _safe_fields(a, last_visit=_fmt_date(last_visits.get(a.PatNum)))
         for a in matches
     ]
 
@@ -5,8 +5,8 @@ Usage:
     python server.py
     Then open http://localhost:5000 in your browser.
 """
-import json
-from datetime import date, datetime
+import hashlib
+from datetime import date
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -14,16 +14,17 @@ from flask import Flask, jsonify, render_template, request
 
 load_dotenv()
 import db
+import jsonout
 from routes.kiosk import kiosk_bp
 
 app = Flask(__name__)
 app.register_blueprint(kiosk_bp)
 
 
-def _json_default(obj):
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    return str(obj)
+def _conditional(resp):
+    """Tag a JSON response with a content-hash ETag; unchanged polls get a bodiless 304."""
+    resp.set_etag(hashlib.blake2b(resp.get_data(), digest_size=8).hexdigest())
+    return resp.make_conditional(request)
 
 
 @app.route("/")
@@ -47,46 +48,26 @@ def appointments():
     output = {
         "date": target_date.isoformat(),
         "appointment_count": len(data["appointments"]),
-        "appointments": data["appointments"],
+        "appointments": [apt._asdict() for apt in data["appointments"]],
         "broken_history": data["broken_history"],
     }
-    return app.response_class(
-        response=json.dumps(output, default=_json_default, ensure_ascii=False),
-        mimetype="application/json",
-    )
+    body = jsonout.dumps(output)
+    return _conditional(app.response_class(response=body, mimetype="application/json"))
 
 
 @app.route("/api/month")
 def month_summary():
     """Return appointment counts for every day in a given month."""
-    year = int(request.args.get("year", date.today().year))
-    month = int(request.args.get("month", date.today().month))
-
-    import mysql.connector, os
-    conn = mysql.connector.connect(
-        host=os.environ["DB_HOST"],
-        port=int(os.environ.get("DB_PORT", "3306")),
-        user=os.environ["DB_USER"],
-        password=os.environ.get("DB_PASSWORD", ""),
-        database=os.environ["DB_NAME"],
-        charset="utf8",
-        use_unicode=True,
-    )
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DATE(AptDateTime) as d, COUNT(*) as cnt
-            FROM appointment
-            WHERE YEAR(AptDateTime) = %s
-              AND MONTH(AptDateTime) = %s
-              AND AptStatus = 1
-            GROUP BY d
-        """, (year, month))
-        counts = {str(row[0]): row[1] for row in cur.fetchall()}
-    finally:
-        conn.close()
-
-    return jsonify(counts)
+        year = int(request.args.get("year", date.today().year))
+        month = int(request.args.get("month", date.today().month))
+        counts = db.get_month_counts(year, month)
+    except ValueError:
+        return jsonify({"error": "Invalid year/month"}), 400
+    except RuntimeError as exc:
+        return jsonify({"error": str(exc)}), 500
+
+    return _conditional(jsonify(counts))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,18 @@
+-- sql/indexes.sql — Composite indexes the assistant's queries assume.
+--
+-- Run once against the Open Dental database (MySQL 5.6 has no
+-- CREATE INDEX IF NOT EXISTS — a "Duplicate key name" error means the
+-- index is already in place):
+--
+--     mysql -h mainserver -u root -p opendental < sql/indexes.sql
+
+-- Scheduled appointments for a day (db.get_appointment_data) and per-day
+-- counts for a month (db.get_month_counts, /api/month):
+--     WHERE AptStatus = 1 AND AptDateTime >= ... AND AptDateTime < ...
+-- Equality on the leading AptStatus column followed by a range on
+-- AptDateTime lets MySQL seek straight to the window instead of scanning.
+CREATE INDEX ix_appt_status_dt ON appointment (AptStatus, AptDateTime);
+
+-- Broken/missed count per appointment row (correlated subquery in db.py):
+--     WHERE AptStatus = 5 AND PatNum = a.PatNum
+CREATE INDEX ix_appt_status_pat ON appointment (AptStatus, PatNum);
@@ -12,18 +12,19 @@ Usage:
     python test_db.py --json-only        # suppress human-readable headers
 """
 import argparse
-import json
 import os
 import sys
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from typing import Any
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+import db  # noqa: E402 — after load_dotenv so the pool sees .env values
+import jsonout  # noqa: E402
+
 try:
-    import mysql.connector
     from mysql.connector import Error as MySQLError
 except ImportError:
     print("ERROR: mysql-connector-python not installed.")
@@ -47,20 +48,8 @@ APT_STATUS_LABELS: dict[int, str] = {
 }
 
 
-def _json_default(obj: Any) -> str:
-    """Make datetime / date objects JSON-serialisable."""
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    return str(obj)
-
-
 def dump(obj: Any) -> str:
-    return json.dumps(obj, indent=2, default=_json_default, ensure_ascii=False)
-
-
-def _rows_as_dicts(cursor: Any) -> list[dict[str, Any]]:
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return jsonout.dumps(obj, indent=True).decode()
 
 
 def _section(title: str, verbose: bool) -> None:
@@ -75,16 +64,18 @@ def _section(title: str, verbose: bool) -> None:
 # Connection
 # ---------------------------------------------------------------------------
 
-def _connect() -> mysql.connector.connection.MySQLConnection:
-    cfg = {
-        "host": os.environ.get("DB_HOST", "mainserver"),
-        "port": int(os.environ.get("DB_PORT", "3306")),
-        "user": os.environ.get("DB_USER", "root"),
-        "password": os.environ.get("DB_PASSWORD", ""),
-        "database": os.environ.get("DB_NAME", "opendental"),
-        "connect_timeout": 10,
-    }
-    return mysql.connector.connect(**cfg)
+_ENV_DEFAULTS = {
+    "DB_HOST": "mainserver",
+    "DB_USER": "root",
+    "DB_NAME": "opendental",
+}
+
+
+def _connect() -> Any:
+    """Check out a connection through db's shared pool, with diagnostic defaults."""
+    for key, value in _ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    return db.get_connection()
 
 
 # ---------------------------------------------------------------------------
@@ -130,9 +121,22 @@ def test_schema(conn: Any, table: str) -> list[dict[str, Any]]:
 
 
 def test_row_counts(conn: Any, tables: list[str]) -> dict[str, int]:
-    """Row count per table — quick sanity check that tables have data."""
+    """Row count per table — quick sanity check that tables have data.
+
+    Exact counts for every table in one UNION ALL round trip; if that fails
+    (e.g. a table is missing), falls back to one query per table so each
+    table still reports its own error.
+    """
     counts: dict[str, int] = {}
     cur = conn.cursor()
+    query = " UNION ALL ".join(
+        f"SELECT %s, COUNT(*) FROM `{table}`" for table in tables
+    )
+    try:
+        cur.execute(query, tables)
+        return {row[0]: row[1] for row in cur.fetchall()}
+    except MySQLError:
+        pass
     for table in tables:
         try:
             cur.execute(f"SELECT COUNT(*) FROM `{table}`")
@@ -208,13 +212,16 @@ def test_appointments_for_date(
         LEFT JOIN  patient    p  ON a.PatNum  = p.PatNum
         LEFT JOIN  provider   pr ON a.ProvNum = pr.ProvNum
         LEFT JOIN  operatory  o  ON a.Op      = o.OperatoryNum
-        WHERE DATE(a.AptDateTime) = %s
-          AND a.AptStatus = 1
+        WHERE a.AptStatus = 1
+          AND a.AptDateTime >= %s
+          AND a.AptDateTime <  %s
         ORDER BY a.AptDateTime ASC
     """
-    cur = conn.cursor()
-    cur.execute(query, (target_date.isoformat(),))
-    return _rows_as_dicts(cur)
+    start = datetime.combine(target_date, time.min)
+    end = start + timedelta(days=1)
+    cur = conn.cursor(dictionary=True)
+    cur.execute(query, (start, end))
+    return cur.fetchall()
 
 
 def test_recent_appointments(conn: Any, days: int = 7) -> list[dict[str, Any]]:
@@ -241,9 +248,9 @@ def test_recent_appointments(conn: Any, days: int = 7) -> list[dict[str, Any]]:
         ORDER BY a.AptDateTime DESC
         LIMIT 25
     """
-    cur = conn.cursor()
+    cur = conn.cursor(dictionary=True)
     cur.execute(query, (days,))
-    return _rows_as_dicts(cur)
+    return cur.fetchall()
 
 
 def test_broken_history(conn: Any, patient_nums: list[int]) -> list[dict[str, Any]]:
@@ -290,7 +297,7 @@ def run_all_tests(target_date: date, lookback_days: int, verbose: bool) -> dict[
     _section("1. Connecting to MySQL", verbose)
     try:
         conn = _connect()
-    except MySQLError as exc:
+    except (MySQLError, RuntimeError) as exc:
         return {"error": f"Connection failed: {exc}"}
 
     try: